@@ -1,5 +1,5 @@
 import asyncio
-import json
+import orjson
 
 from fastmcp import Client
 
@@ -11,15 +11,19 @@ async def test_server():
         tools = await client.list_tools()
         for tool in tools:
             print(f">>> Tool found: {tool.name}")
-        # Call get_weather tool
-        print(">>>  Calling get weather tool for London")
-        result = await client.call_tool("get_weather", {"city": "London"})
+        # Call get_weather and get_air_pollution tools concurrently
+        print(">>>  Calling get weather and get air pollution tools for London")
+        weather, pollution = await asyncio.gather(
+            client.call_tool("get_weather", {"city": "London"}),
+            client.call_tool("get_air_pollution", {"city": "London"}),
+        )
+        result = weather
         # The result data is now a dictionary
         print(f"<<<  Result (raw): {result.data}")
         if isinstance(result.data, dict) and "error" not in result.data:
             # Pretty-print the JSON for readability
             print("<<< Result (formatted):")
-            print(json.dumps(result.data, indent=2))
+            print(orjson.dumps(result.data, option=orjson.OPT_INDENT_2).decode())
             try:
                 temp = result.data.get("main", {}).get("temp")
                 desc = result.data.get("weather", [{}])[0].get("description")
@@ -29,13 +33,13 @@ async def test_server():
         else:
             print(f"Received an error or unexpected data: {result.data}")
         
-        # Call get_air_pollution tool
-        print("\n>>>  Calling get air pollution tool for London")
-        result = await client.call_tool("get_air_pollution", {"city": "London"})
+        # Air pollution result
+        print("\n>>>  Air pollution for London")
+        result = pollution
         print(f"<<<  Result (raw): {result.data}")
         if isinstance(result.data, dict) and "error" not in result.data:
             print("<<< Result (formatted):")
-            print(json.dumps(result.data, indent=2))
+            print(orjson.dumps(result.data, option=orjson.OPT_INDENT_2).decode())
             try:
                 aqi = result.data.get("list", [{}])[0].get("main", {}).get("aqi")
                 print(f"Air Quality Index (AQI) in London: {aqi}")
@@ -47,18 +51,25 @@ async def test_server():
         # List and read all available MCP Resources
         print("\n>>> Listing and reading all available resources")
         resources = await client.list_resources()
-        for resource in resources:
+        # Read resources concurrently, but at most 10 at a time.
+        sem = asyncio.Semaphore(10)
+
+        async def read_one(resource):
+            async with sem:
+                return resource, await client.read_resource(uri=resource.uri)
+
+        results = await asyncio.gather(*(read_one(resource) for resource in resources))
+        for resource, resource_data in results:
             print(f"\n>>> Getting resource '{resource.uri}'")
-            resource_data = await client.read_resource(uri=resource.uri)
             content = resource_data[0].text
             print(f"<<< Resource data (raw text): {content}")
 
             # Try to parse as JSON for pretty printing
             try:
-                data_json = json.loads(content)
+                data_json = orjson.loads(content)
                 print("<<< Resource data (formatted JSON):")
-                print(json.dumps(data_json, indent=2))
-            except json.JSONDecodeError:
+                print(orjson.dumps(data_json, option=orjson.OPT_INDENT_2).decode())
+            except orjson.JSONDecodeError:
                 # Not a JSON, just print the raw text
                 print("<<< Resource data is not JSON.")
 
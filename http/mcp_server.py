@@ -1,9 +1,12 @@
 import os
 import httpx
-from typing import Optional, Tuple
+import aiosqlite
+import sqlite3
+from cachetools import LRUCache, TTLCache
+from typing import Dict, Optional, Tuple
 import logging
 import asyncio
-import json
+import orjson
 from fastmcp import FastMCP
 
 
@@ -11,10 +14,23 @@ OPENWEATHER_API_KEY = os.getenv("OPENWEATHER_API_KEY")
 if not OPENWEATHER_API_KEY:
     raise RuntimeError("Set OPENWEATHER_API_KEY environment variable")
 
-GEOCODING_URL = "https://api.openweathermap.org/geo/1.0/direct"
-WEATHER_URL = "https://api.openweathermap.org/data/2.5/weather"
-AIR_POLLUTION_CURRENT_URL = "https://api.openweathermap.org/data/2.5/air_pollution"
-AIR_POLLUTION_FORECAST_URL = "https://api.openweathermap.org/data/2.5/air_pollution/forecast"
+# Query params shared by every request, built once instead of on each call.
+_BASE_PARAMS = {"appid": OPENWEATHER_API_KEY}
+_BASE_PARAMS_METRIC = {"appid": OPENWEATHER_API_KEY, "units": "metric"}
+
+OPENWEATHER_BASE_URL = "https://api.openweathermap.org"
+GEOCODING_PATH = "/geo/1.0/direct"
+WEATHER_PATH = "/data/2.5/weather"
+AIR_POLLUTION_CURRENT_PATH = "/data/2.5/air_pollution"
+AIR_POLLUTION_FORECAST_PATH = "/data/2.5/air_pollution/forecast"
+
+# Popular cities geocoded at startup so their first lookup is served from the cache.
+STARTUP_CITIES = (
+    "London", "Paris", "Berlin", "Madrid", "Rome", "Milan", "Amsterdam",
+    "New York", "Los Angeles", "Chicago", "Toronto", "Mexico City", "Sao Paulo",
+    "Tokyo", "Beijing", "Shanghai", "Seoul", "Singapore", "Mumbai", "Delhi",
+    "Dubai", "Istanbul", "Moscow", "Cairo", "Lagos", "Sydney",
+)
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(format="[%(levelname)s]: %(message)s", level=logging.INFO)
@@ -22,14 +38,128 @@ logging.basicConfig(format="[%(levelname)s]: %(message)s", level=logging.INFO)
 app = FastMCP("openweather-mcp")
 
 # --- Helpers ---
-_geocode_cache = {}
+# Bounded so arbitrary city names cannot grow the cache indefinitely.
+_geocode_cache: LRUCache = LRUCache(maxsize=4096)
+# City coordinates never change, so they are also persisted for warm restarts.
+# Stored next to this file by default so it does not depend on the working directory.
+GEOCODE_DB_PATH = os.getenv(
+    "GEOCODE_DB_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "geocode.db")
+)
+_db: Optional[aiosqlite.Connection] = None
+# Lookups currently in progress, so concurrent callers for a city share one request.
+_inflight_geocodes: Dict[str, "asyncio.Future[Optional[Tuple[float, float]]]"] = {}
+_client: Optional[httpx.AsyncClient] = None
+# OpenWeather refreshes current weather and air pollution about every 10 minutes.
+_weather_cache: TTLCache = TTLCache(maxsize=1024, ttl=300)
+_air_pollution_cache: TTLCache = TTLCache(maxsize=1024, ttl=300)
+
+def _get_client() -> httpx.AsyncClient:
+    """Return the shared httpx client, creating it on first use.
+
+    A single client is reused across tool calls so that connections to the
+    OpenWeather API are kept alive instead of being re-established every time.
+    """
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            base_url=OPENWEATHER_BASE_URL,
+            timeout=10,
+            limits=httpx.Limits(max_keepalive_connections=20, max_connections=50),
+            http2=True,
+        )
+    return _client
+
+async def _close_client() -> None:
+    """Close the shared httpx client, if it was ever created."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+def _error_text(r: httpx.Response) -> str:
+    """Decode at most the first 512 bytes of an error response body."""
+    return r.content[:512].decode("utf-8", "replace")
+
+def _city_key(city: str) -> str:
+    """Normalize a city name so that e.g. "London" and "london " share a cache entry."""
+    return city.strip().lower()
+
+async def _open_db() -> None:
+    """Open the SQLite database persisting geocoded coordinates across restarts.
+
+    Persistence is best-effort: if the database cannot be opened, the server
+    keeps running with the in-memory cache only.
+    """
+    global _db
+    db = None
+    try:
+        db = await aiosqlite.connect(GEOCODE_DB_PATH)
+        await db.execute("CREATE TABLE IF NOT EXISTS geo(city TEXT PRIMARY KEY, lat REAL, lon REAL)")
+        await db.commit()
+    except (sqlite3.Error, OSError) as e:
+        logger.warning(f"Could not open geocode database '{GEOCODE_DB_PATH}', using memory only: {e}")
+        if db is not None:
+            await db.close()
+        return
+    _db = db
+
+async def _close_db() -> None:
+    """Close the geocode database, if it was opened."""
+    global _db
+    if _db is not None:
+        await _db.close()
+        _db = None
+
+async def _load_coords(key: str) -> Optional[Tuple[float, float]]:
+    """Look up coordinates in the in-memory cache, then in the geocode database.
+
+    Args:
+        key: The normalized city name, as returned by _city_key.
+
+    Returns:
+        A tuple of (latitude, longitude) or None if the city was never geocoded.
+    """
+    if key in _geocode_cache:
+        return _geocode_cache[key]
+    if _db is None:
+        return None
+    try:
+        async with _db.execute("SELECT lat, lon FROM geo WHERE city = ?", (key,)) as cursor:
+            row = await cursor.fetchone()
+    except (sqlite3.Error, OSError) as e:
+        logger.warning(f"Could not read geocode database: {e}")
+        return None
+    if row is None:
+        return None
+    _geocode_cache[key] = (row[0], row[1])
+    return _geocode_cache[key]
+
+async def _store_coords(key: str, lat: float, lon: float) -> None:
+    """Store coordinates in the in-memory cache and in the geocode database.
+
+    Args:
+        key: The normalized city name, as returned by _city_key.
+        lat: The latitude of the city.
+        lon: The longitude of the city.
+    """
+    _geocode_cache[key] = (lat, lon)
+    if _db is None:
+        return
+    try:
+        await _db.execute("INSERT OR REPLACE INTO geo(city, lat, lon) VALUES (?, ?, ?)", (key, lat, lon))
+        await _db.commit()
+    except (sqlite3.Error, OSError) as e:
+        logger.warning(f"Could not write geocode database: {e}")
 
 async def _geocode_city(city: str) -> Optional[Tuple[float, float]]:
     """Use the OpenWeather Geocoding API to find coordinates for a city.
 
-    This function is async and uses httpx.
+    This function is async and uses the shared httpx client.
 
-    Results are cached in memory to avoid repeated API calls for the same city.
+    Results are cached in a bounded in-memory LRU cache, backed by a SQLite
+    database that survives restarts, to avoid repeated API calls for the same
+    city. City names are matched case-insensitively, and concurrent lookups of
+    the same uncached city share a single request.
 
     Args:
         city: The name of the city to geocode.
@@ -37,38 +167,95 @@ async def _geocode_city(city: str) -> Optional[Tuple[float, float]]:
     Returns:
         A tuple of (latitude, longitude) or None if the city cannot be found.
     """
-    if city in _geocode_cache:
-        return _geocode_cache[city]
-    params = {"q": city, "limit": 1, "appid": OPENWEATHER_API_KEY}
-    async with httpx.AsyncClient() as client:
-        r = await client.get(GEOCODING_URL, params=params, timeout=10)
-        r.raise_for_status()
-        data = r.json()
-        if not data:
-            return None
-        lat, lon = data[0]["lat"], data[0]["lon"]
-        _geocode_cache[city] = (lat, lon)
-        return lat, lon
+    key = _city_key(city)
+    if key in _geocode_cache:
+        return _geocode_cache[key]
+    task = _inflight_geocodes.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_fetch_coords(city, key))
+        _inflight_geocodes[key] = task
+        task.add_done_callback(lambda _: _inflight_geocodes.pop(key, None))
+    # Shielded so a cancelled caller does not cancel the lookup for the others.
+    return await asyncio.shield(task)
+
+async def _fetch_coords(city: str, key: str) -> Optional[Tuple[float, float]]:
+    """Resolve a city from the geocode database, falling back to the Geocoding API."""
+    coords = await _load_coords(key)
+    if coords:
+        return coords
+    params = {**_BASE_PARAMS, "q": city, "limit": 1}
+    r = await _get_client().get(GEOCODING_PATH, params=params)
+    r.raise_for_status()
+    data = orjson.loads(r.content)
+    if not data:
+        return None
+    lat, lon = data[0]["lat"], data[0]["lon"]
+    await _store_coords(key, lat, lon)
+    return lat, lon
 
 async def _get_weather_logic(city: str) -> dict:
-    """Core logic to fetch current weather for a city."""
+    """Core logic to fetch current weather for a city.
+
+    Cities that are not yet geocoded are looked up by name directly, saving a
+    round trip to the Geocoding API. The coordinates returned by the weather
+    endpoint are then cached for later calls.
+
+    Successful responses are cached for a few minutes.
+    """
+    key = _city_key(city)
+    if key in _weather_cache:
+        return _weather_cache[key]
+    coords = await _load_coords(key)
+    if coords:
+        lat, lon = coords
+        params = {**_BASE_PARAMS_METRIC, "lat": lat, "lon": lon}
+    else:
+        params = {**_BASE_PARAMS_METRIC, "q": city}
+    try:
+        r = await _get_client().get(WEATHER_PATH, params=params)
+        r.raise_for_status()
+    except httpx.HTTPStatusError as e:
+        # An unknown city name is reported the same way as a failed geocode.
+        if "q" in params and e.response.status_code == 404:
+            return {"error": f"Could not resolve city '{city}'"}
+        return {"error": f"Weather API failed: {_error_text(e.response)}"}
+    data = orjson.loads(r.content)
+    if not coords and "coord" in data:
+        await _store_coords(key, data["coord"]["lat"], data["coord"]["lon"])
+    _weather_cache[key] = data
+    return data
+
+async def _get_air_pollution_logic(city: str, forecast: bool = False) -> dict:
+    """Core logic to fetch current or forecast air pollution for a city.
+
+    Successful responses are cached for a few minutes.
+    """
+    cache_key = (_city_key(city), forecast)
+    if cache_key in _air_pollution_cache:
+        return _air_pollution_cache[cache_key]
     coords = await _geocode_city(city)
     if not coords:
         return {"error": f"Could not resolve city '{city}'"}
+    
     lat, lon = coords
-    params = {"lat": lat, "lon": lon, "appid": OPENWEATHER_API_KEY, "units": "metric"}
-    async with httpx.AsyncClient() as client:
-        r = await client.get(WEATHER_URL, params=params, timeout=10)
-        if r.status_code != 200:
-            return {"error": f"Weather API failed: {r.text}"}
-        return r.json()
+    path = AIR_POLLUTION_FORECAST_PATH if forecast else AIR_POLLUTION_CURRENT_PATH
+    params = {**_BASE_PARAMS, "lat": lat, "lon": lon}
+
+    try:
+        r = await _get_client().get(path, params=params)
+        r.raise_for_status()
+    except httpx.HTTPStatusError as e:
+        return {"error": f"Air Pollution API failed: {_error_text(e.response)}"}
+    data = orjson.loads(r.content)
+    _air_pollution_cache[cache_key] = data
+    return data
 
 # --- Tools ---
 
 @app.tool()
 async def get_weather(city: str) -> dict:
     """
-    Fetch current weather for a city using OpenWeather (via geocoding).
+    Fetch current weather for a city using OpenWeather (looked up by city name).
 
     Args:
         city: The name of the city (e.g., "London", "Tokyo").
@@ -85,19 +272,30 @@ async def get_air_pollution(city: str, forecast: bool = False) -> dict:
         city: The name of the city (e.g., "London", "Tokyo").
         forecast: If True, fetch the forecast instead of current data. Defaults to False.
     """
+    return await _get_air_pollution_logic(city, forecast)
+
+@app.tool()
+async def get_weather_and_pollution(city: str) -> dict:
+    """Fetch current weather and current air pollution data for a city.
+
+    The city is geocoded once and both APIs are then queried concurrently.
+
+    Args:
+        city: The name of the city (e.g., "London", "Tokyo").
+    """
     coords = await _geocode_city(city)
     if not coords:
         return {"error": f"Could not resolve city '{city}'"}
-    
-    lat, lon = coords
-    url = AIR_POLLUTION_FORECAST_URL if forecast else AIR_POLLUTION_CURRENT_URL
-    params = {"lat": lat, "lon": lon, "appid": OPENWEATHER_API_KEY}
-
-    async with httpx.AsyncClient() as client:
-        r = await client.get(url, params=params, timeout=10)
-        if r.status_code != 200:
-            return {"error": f"Air Pollution API failed: {r.text}"}
-        return r.json()
+
+    # Both lookups now find the coordinates in the geocode cache.
+    weather, pollution = await asyncio.gather(
+        _get_weather_logic(city),
+        _get_air_pollution_logic(city),
+    )
+    for result in (weather, pollution):
+        if "error" in result:
+            return result
+    return {"weather": weather, "air_pollution": pollution}
     
 # --- Resources ---
 @app.resource(
@@ -105,8 +303,9 @@ async def get_air_pollution(city: str, forecast: bool = False) -> dict:
         description="Weather in London",
         mime_type="application/json"
 )
-async def london_resource() -> dict:
-    return await _get_weather_logic("London")
+async def london_resource() -> str:
+    # Serialized here with orjson so FastMCP passes the text through as-is.
+    return orjson.dumps(await _get_weather_logic("London")).decode()
 
 @app.resource(
         uri="file://documents/ai_poem",
@@ -122,12 +321,40 @@ async def ai_poem_resource() -> str:
         return "File not found"
 
 
-if __name__ == "__main__":
-    logger.info(f"MCP Server started on port {os.getenv('PORT',8080)}")
-    asyncio.run(
-        app.run_async(
+async def _warm_geocode_cache() -> None:
+    """Geocode STARTUP_CITIES concurrently, loading them from the database when possible."""
+    results = await asyncio.gather(
+        *(_geocode_city(city) for city in STARTUP_CITIES), return_exceptions=True
+    )
+    for city, result in zip(STARTUP_CITIES, results):
+        if isinstance(result, Exception):
+            logger.warning(f"Could not warm geocode cache for '{city}': {result}")
+
+
+async def main():
+    await _open_db()
+    # Warmed in the background so serving never waits on the Geocoding API.
+    # Kept in a variable so the task is not garbage collected while running.
+    warm_task = asyncio.create_task(_warm_geocode_cache())
+    try:
+        await app.run_async(
             transport="streamable-http",
             host="0.0.0.0",
             port=os.getenv("PORT", 8080),
         )
-    )
+    finally:
+        warm_task.cancel()
+        await _close_client()
+        await _close_db()
+
+
+if __name__ == "__main__":
+    logger.info(f"MCP Server started on port {os.getenv('PORT',8080)}")
+    try:
+        import uvloop
+    except ImportError:
+        # uvloop is not available on Windows, keep the default event loop.
+        logger.info("uvloop not installed, using the default asyncio event loop")
+        asyncio.run(main())
+    else:
+        uvloop.run(main())
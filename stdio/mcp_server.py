@@ -1,29 +1,170 @@
 #!/usr/bin/env python3
 import os
-import requests
-from datetime import datetime
-from typing import Optional, Tuple
+import asyncio
+import httpx
+import orjson
+import aiosqlite
+import sqlite3
+from cachetools import LRUCache, TTLCache
+from contextlib import asynccontextmanager
+import logging
+import time
+from typing import AsyncIterator, Dict, Optional, Tuple
 from mcp.server.fastmcp import FastMCP
 
 API_KEY = os.environ.get("OPENWEATHER_API_KEY")
 if not API_KEY:
     raise RuntimeError("Set OPENWEATHER_API_KEY environment variable")
 
-GEOCODING_URL = "https://api.openweathermap.org/geo/1.0/direct"
-WEATHER_URL = "https://api.openweathermap.org/data/2.5/weather"
-FORECAST5_URL = "https://api.openweathermap.org/data/2.5/forecast"
-AIR_POLLUTION_CURRENT_URL = "https://api.openweathermap.org/data/2.5/air_pollution"
-AIR_POLLUTION_FORECAST_URL = "https://api.openweathermap.org/data/2.5/air_pollution/forecast"
+# Query params shared by every request, built once instead of on each call.
+_BASE_PARAMS = {"appid": API_KEY}
+_BASE_PARAMS_METRIC = {"appid": API_KEY, "units": "metric"}
 
-app = FastMCP("openweather-mcp")
+OPENWEATHER_BASE_URL = "https://api.openweathermap.org"
+GEOCODING_PATH = "/geo/1.0/direct"
+WEATHER_PATH = "/data/2.5/weather"
+FORECAST5_PATH = "/data/2.5/forecast"
+AIR_POLLUTION_CURRENT_PATH = "/data/2.5/air_pollution"
+AIR_POLLUTION_FORECAST_PATH = "/data/2.5/air_pollution/forecast"
+
+# Air pollution components reported by the formatters, with their display labels.
+_COMPS = ("pm2_5", "pm10", "no2", "o3", "so2", "co", "nh3")
+_COMPS_UPPER = tuple(c.upper() for c in _COMPS)
+
+logger = logging.getLogger(__name__)
 
 # --- Helpers ---
-_geocode_cache = {}
+# Bounded so arbitrary city names cannot grow the cache indefinitely.
+_geocode_cache: LRUCache = LRUCache(maxsize=4096)
+# City coordinates never change, so they are also persisted for warm restarts.
+# Stored next to this file by default so it does not depend on the working directory.
+GEOCODE_DB_PATH = os.getenv(
+    "GEOCODE_DB_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "geocode.db")
+)
+_db: Optional[aiosqlite.Connection] = None
+# Lookups currently in progress, so concurrent callers for a city share one request.
+_inflight_geocodes: Dict[str, "asyncio.Future[Optional[Tuple[float, float]]]"] = {}
+_client: Optional[httpx.AsyncClient] = None
+# OpenWeather refreshes current weather and air pollution about every 10 minutes.
+_weather_cache: TTLCache = TTLCache(maxsize=1024, ttl=300)
+_air_pollution_cache: TTLCache = TTLCache(maxsize=1024, ttl=300)
+
+def _get_client() -> httpx.AsyncClient:
+    """Return the shared httpx client, creating it on first use.
+
+    Tools are async and share one client, so concurrent tool calls neither
+    block the event loop nor re-establish connections to the OpenWeather API.
+    """
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            base_url=OPENWEATHER_BASE_URL,
+            timeout=10,
+            limits=httpx.Limits(max_keepalive_connections=20, max_connections=50),
+        )
+    return _client
+
+async def _close_client() -> None:
+    """Close the shared httpx client, if it was ever created."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+@asynccontextmanager
+async def _lifespan(server: FastMCP) -> AsyncIterator[None]:
+    """Open the geocode database on startup; close it and the shared httpx client on shutdown."""
+    await _open_db()
+    try:
+        yield
+    finally:
+        await _close_client()
+        await _close_db()
+
+app = FastMCP("openweather-mcp", lifespan=_lifespan)
+
+def _error_text(r: httpx.Response) -> str:
+    """Decode at most the first 512 bytes of an error response body."""
+    return r.content[:512].decode("utf-8", "replace")
+
+def _city_key(city: str) -> str:
+    """Normalize a city name so that e.g. "London" and "london " share a cache entry."""
+    return city.strip().lower()
+
+async def _open_db() -> None:
+    """Open the SQLite database persisting geocoded coordinates across restarts.
+
+    Persistence is best-effort: if the database cannot be opened, the server
+    keeps running with the in-memory cache only.
+    """
+    global _db
+    db = None
+    try:
+        db = await aiosqlite.connect(GEOCODE_DB_PATH)
+        await db.execute("CREATE TABLE IF NOT EXISTS geo(city TEXT PRIMARY KEY, lat REAL, lon REAL)")
+        await db.commit()
+    except (sqlite3.Error, OSError) as e:
+        logger.warning(f"Could not open geocode database '{GEOCODE_DB_PATH}', using memory only: {e}")
+        if db is not None:
+            await db.close()
+        return
+    _db = db
+
+async def _close_db() -> None:
+    """Close the geocode database, if it was opened."""
+    global _db
+    if _db is not None:
+        await _db.close()
+        _db = None
+
+async def _load_coords(key: str) -> Optional[Tuple[float, float]]:
+    """Look up coordinates in the in-memory cache, then in the geocode database.
+
+    Args:
+        key: The normalized city name, as returned by _city_key.
+
+    Returns:
+        A tuple of (latitude, longitude) or None if the city was never geocoded.
+    """
+    if key in _geocode_cache:
+        return _geocode_cache[key]
+    if _db is None:
+        return None
+    try:
+        async with _db.execute("SELECT lat, lon FROM geo WHERE city = ?", (key,)) as cursor:
+            row = await cursor.fetchone()
+    except (sqlite3.Error, OSError) as e:
+        logger.warning(f"Could not read geocode database: {e}")
+        return None
+    if row is None:
+        return None
+    _geocode_cache[key] = (row[0], row[1])
+    return _geocode_cache[key]
+
+async def _store_coords(key: str, lat: float, lon: float) -> None:
+    """Store coordinates in the in-memory cache and in the geocode database.
+
+    Args:
+        key: The normalized city name, as returned by _city_key.
+        lat: The latitude of the city.
+        lon: The longitude of the city.
+    """
+    _geocode_cache[key] = (lat, lon)
+    if _db is None:
+        return
+    try:
+        await _db.execute("INSERT OR REPLACE INTO geo(city, lat, lon) VALUES (?, ?, ?)", (key, lat, lon))
+        await _db.commit()
+    except (sqlite3.Error, OSError) as e:
+        logger.warning(f"Could not write geocode database: {e}")
 
-def geocode_city(city: str) -> Optional[Tuple[float, float]]:
+async def geocode_city(city: str) -> Optional[Tuple[float, float]]:
     """Use the OpenWeather Geocoding API to find coordinates for a city.
 
-    Results are cached in memory to avoid repeated API calls for the same city.
+    Results are cached in a bounded in-memory LRU cache, backed by a SQLite
+    database that survives restarts, to avoid repeated API calls for the same
+    city. City names are matched case-insensitively, and concurrent lookups of
+    the same uncached city share a single request.
 
     Args:
         city: The name of the city to geocode.
@@ -31,18 +172,61 @@ def geocode_city(city: str) -> Optional[Tuple[float, float]]:
     Returns:
         A tuple of (latitude, longitude) or None if the city cannot be found.
     """
-    if city in _geocode_cache:
-        return _geocode_cache[city]
-    params = {"q": city, "limit": 1, "appid": API_KEY}
-    r = requests.get(GEOCODING_URL, params=params, timeout=10)
+    key = _city_key(city)
+    if key in _geocode_cache:
+        return _geocode_cache[key]
+    task = _inflight_geocodes.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_fetch_coords(city, key))
+        _inflight_geocodes[key] = task
+        task.add_done_callback(lambda _: _inflight_geocodes.pop(key, None))
+    # Shielded so a cancelled caller does not cancel the lookup for the others.
+    return await asyncio.shield(task)
+
+async def _fetch_coords(city: str, key: str) -> Optional[Tuple[float, float]]:
+    """Resolve a city from the geocode database, falling back to the Geocoding API."""
+    coords = await _load_coords(key)
+    if coords:
+        return coords
+    params = {**_BASE_PARAMS, "q": city, "limit": 1}
+    r = await _get_client().get(GEOCODING_PATH, params=params)
     r.raise_for_status()
-    data = r.json()
+    data = orjson.loads(r.content)
     if not data:
         return None
     lat, lon = data[0]["lat"], data[0]["lon"]
-    _geocode_cache[city] = (lat, lon)
+    await _store_coords(key, lat, lon)
     return lat, lon
 
+async def _location_params(city: str) -> dict:
+    """Build metric query params locating a city for the weather and forecast endpoints.
+
+    Both endpoints accept the city name directly, so the Geocoding API is only
+    needed when coordinates are not cached yet for endpoints that require them.
+
+    Args:
+        city: The name of the city.
+
+    Returns:
+        A dict of query params using cached coordinates if available, the city name otherwise.
+    """
+    coords = await _load_coords(_city_key(city))
+    if coords:
+        lat, lon = coords
+        return {**_BASE_PARAMS_METRIC, "lat": lat, "lon": lon}
+    return {**_BASE_PARAMS_METRIC, "q": city}
+
+async def _cache_coords(city: str, coord: Optional[dict]) -> None:
+    """Store the coordinates returned by a weather response in the geocode cache."""
+    key = _city_key(city)
+    if coord and key not in _geocode_cache:
+        await _store_coords(key, coord["lat"], coord["lon"])
+
+def _fmt_ts(ts: int) -> str:
+    """Format a Unix timestamp as local "YYYY-MM-DD HH:MM" without building a datetime."""
+    tm = time.localtime(ts)
+    return f"{tm.tm_year}-{tm.tm_mon:02d}-{tm.tm_mday:02d} {tm.tm_hour:02d}:{tm.tm_min:02d}"
+
 def format_weather_short(j: dict) -> str:
     """Formats the raw JSON response from the OpenWeather current weather API into a short, human-readable string.
 
@@ -54,12 +238,17 @@ def format_weather_short(j: dict) -> str:
     Returns:
         A formatted string summarizing the current weather, e.g., "London, GB: 15.2°C, clear sky".
     """
-    name = j.get("name") or ""
-    country = j.get("sys", {}).get("country", "")
-    place = f"{name}, {country}".strip(", ")
-    temp = j.get("main", {}).get("temp")
-    desc = j.get("weather", [{}])[0].get("description", "")
-    return f"{place}: {temp}°C, {desc}"
+    try:
+        place = f"{j['name'] or ''}, {j['sys']['country']}".strip(", ")
+        return f"{place}: {j['main']['temp']}°C, {j['weather'][0]['description']}"
+    except (KeyError, IndexError):
+        # Some fields are missing, fall back to defaults for each of them.
+        name = j.get("name") or ""
+        country = j.get("sys", {}).get("country", "")
+        place = f"{name}, {country}".strip(", ")
+        temp = j.get("main", {}).get("temp")
+        desc = (j.get("weather") or [{}])[0].get("description", "")
+        return f"{place}: {temp}°C, {desc}"
 
 def format_forecast5_short(j: dict, limit: int = 5) -> str:
     """Formats the raw JSON response from the 5-day forecast API into a human-readable string.
@@ -73,64 +262,67 @@ def format_forecast5_short(j: dict, limit: int = 5) -> str:
     """
     city = j.get("city", {}).get("name", "Unknown")
     lines = [f"5-day / 3-hour forecast for {city} (first {limit} slots):"]
-    for entry in j.get("list", [])[:limit]:
-        dt = datetime.fromtimestamp(entry["dt"]).strftime("%Y-%m-%d %H:%M")
+    for entry in j.get("list", ())[:limit]:
+        dt = _fmt_ts(entry["dt"])
         temp = entry["main"]["temp"]
         desc = entry["weather"][0]["description"]
         lines.append(f"{dt}: {temp}°C, {desc}")
     return "\n".join(lines)
 
+def _format_components(comps: dict) -> str:
+    """Format the known pollutant concentrations, e.g. "PM2_5=3.10, PM10=5.42"."""
+    return ", ".join(f"{u}={comps[c]:.2f}" for c, u in zip(_COMPS, _COMPS_UPPER) if c in comps)
+
 def format_air_pollution_current(j: dict) -> str:
     """
     Format the current air pollution response nicely.
     j is JSON from /air_pollution endpoint.
     """
     try:
-        item = j.get("list", [])[0]
+        item = j["list"][0]
         aqi = item["main"]["aqi"]
         comps = item["components"]
-        parts = []
-        for comp in ["pm2_5", "pm10", "no2", "o3", "so2", "co", "nh3"]:
-            if comp in comps:
-                parts.append(f"{comp.upper()}={comps[comp]:.2f}")
-        return f"AQI: {aqi}. Components: " + ", ".join(parts)
+        return f"AQI: {aqi}. Components: " + _format_components(comps)
     except Exception:
         return "Unable to parse air pollution data"
 
 def format_air_pollution_forecast(j: dict, limit: int = 5) -> str:
-    city = "unknown"
     lines = ["Air pollution forecast:"]
-    for entry in j.get("list", [])[:limit]:
-        dt = datetime.fromtimestamp(entry["dt"]).strftime("%Y-%m-%d %H:%M")
+    for entry in j.get("list", ())[:limit]:
+        dt = _fmt_ts(entry["dt"])
         aqi = entry["main"]["aqi"]
         comps = entry["components"]
-        parts = []
-        for comp in ["pm2_5", "pm10", "no2", "o3", "so2", "co", "nh3"]:
-            if comp in comps:
-                parts.append(f"{comp.upper()}={comps[comp]:.2f}")
-        lines.append(f"{dt} — AQI {aqi}: " + ", ".join(parts))
+        lines.append(f"{dt} — AQI {aqi}: " + _format_components(comps))
     return "\n".join(lines)
 
 # --- Tools ---
 @app.tool()
-def get_weather(city: str) -> str:
+async def get_weather(city: str) -> str:
     """
-    Fetch current weather for a city using OpenWeather (via geocoding).
+    Fetch current weather for a city using OpenWeather (looked up by city name).
 
     Args:
         city: The name of the city (e.g., "London", "Tokyo").
     """
-    coords = geocode_city(city)
-    if not coords:
-        return f"Could not resolve city '{city}'"
-    lat, lon = coords
-    r = requests.get(WEATHER_URL, params={"lat": lat, "lon": lon, "appid": API_KEY, "units": "metric"}, timeout=10)
-    if r.status_code != 200:
-        return f"Weather API failed: {r.text}"
-    return format_weather_short(r.json())
+    key = _city_key(city)
+    j = _weather_cache.get(key)
+    if j is None:
+        params = await _location_params(city)
+        try:
+            r = await _get_client().get(WEATHER_PATH, params=params)
+            r.raise_for_status()
+        except httpx.HTTPStatusError as e:
+            # An unknown city name is reported the same way as a failed geocode.
+            if "q" in params and e.response.status_code == 404:
+                return f"Could not resolve city '{city}'"
+            return f"Weather API failed: {_error_text(e.response)}"
+        j = orjson.loads(r.content)
+        await _cache_coords(city, j.get("coord"))
+        _weather_cache[key] = j
+    return format_weather_short(j)
 
 @app.tool()
-def get_forecast_5d(city: str, slots: int = 5) -> str:
+async def get_forecast_5d(city: str, slots: int = 5) -> str:
     """Fetch 5-day weather forecast for a city.
 
     The forecast provides data in 3-hour intervals.
@@ -139,17 +331,21 @@ def get_forecast_5d(city: str, slots: int = 5) -> str:
         city: The name of the city (e.g., "London", "Tokyo").
         slots: The number of 3-hour forecast slots to return. Defaults to 5.
     """
-    coords = geocode_city(city)
-    if not coords:
-        return f"Could not resolve city '{city}'"
-    lat, lon = coords
-    r = requests.get(FORECAST5_URL, params={"lat": lat, "lon": lon, "appid": API_KEY, "units": "metric"}, timeout=10)
-    if r.status_code != 200:
-        return f"Forecast API failed: {r.text}"
-    return format_forecast5_short(r.json(), limit=slots)
+    params = await _location_params(city)
+    try:
+        r = await _get_client().get(FORECAST5_PATH, params=params)
+        r.raise_for_status()
+    except httpx.HTTPStatusError as e:
+        # An unknown city name is reported the same way as a failed geocode.
+        if "q" in params and e.response.status_code == 404:
+            return f"Could not resolve city '{city}'"
+        return f"Forecast API failed: {_error_text(e.response)}"
+    j = orjson.loads(r.content)
+    await _cache_coords(city, j.get("city", {}).get("coord"))
+    return format_forecast5_short(j, limit=slots)
 
 @app.tool()
-def get_air_pollution(city: str, forecast: bool = False, limit: int = 5) -> str:
+async def get_air_pollution(city: str, forecast: bool = False, limit: int = 5) -> str:
     """Fetch air pollution data for a city.
 
     Can retrieve either the current air pollution data or a forecast.
@@ -159,20 +355,26 @@ def get_air_pollution(city: str, forecast: bool = False, limit: int = 5) -> str:
         forecast: If True, fetch the forecast instead of current data. Defaults to False.
         limit: The number of forecast slots to return (only used if forecast=True). Defaults to 5.
     """
-    coords = geocode_city(city)
-    if not coords:
-        return f"Could not resolve city '{city}'"
-    lat, lon = coords
+    cache_key = (_city_key(city), forecast)
+    j = _air_pollution_cache.get(cache_key)
+    if j is None:
+        coords = await geocode_city(city)
+        if not coords:
+            return f"Could not resolve city '{city}'"
+        lat, lon = coords
 
-    if forecast:
-        url = AIR_POLLUTION_FORECAST_URL
-    else:
-        url = AIR_POLLUTION_CURRENT_URL
+        if forecast:
+            path = AIR_POLLUTION_FORECAST_PATH
+        else:
+            path = AIR_POLLUTION_CURRENT_PATH
 
-    r = requests.get(url, params={"lat": lat, "lon": lon, "appid": API_KEY}, timeout=10)
-    if r.status_code != 200:
-        return f"Air Pollution API failed: {r.text}"
-    j = r.json()
+        try:
+            r = await _get_client().get(path, params={**_BASE_PARAMS, "lat": lat, "lon": lon})
+            r.raise_for_status()
+        except httpx.HTTPStatusError as e:
+            return f"Air Pollution API failed: {_error_text(e.response)}"
+        j = orjson.loads(r.content)
+        _air_pollution_cache[cache_key] = j
 
     if forecast:
         return format_air_pollution_forecast(j, limit=limit)